@@ -4,15 +4,45 @@
 # vim: ai:
 # vim: shiftwidth=4:
 
+import contextlib
 import csv
+import functools
+import gzip
+import importlib
+import io
 import optparse
 import os
-import yaml
 import sys
-import edtf_validate.valid_edtf
-import requests
 import datetime
-from requests.auth import HTTPBasicAuth
+import bisect
+import unicodedata
+import threading
+import time
+import concurrent.futures
+from collections import deque
+from collections import namedtuple
+
+
+class LazyModule(object):
+    """
+    Stands in for a module and imports it the first time one of its
+    attributes is used. --help and argument errors then import none of
+    requests, yaml and edtf_validate, and --offline runs never import
+    requests.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+yaml = LazyModule('yaml')
+requests = LazyModule('requests')
+valid_edtf = LazyModule('edtf_validate.valid_edtf')
+zstandard = LazyModule('zstandard')
 
 
 ## Run this script with an input file.
@@ -24,12 +54,64 @@ def parse_cmd_line():
     parser = optparse.OptionParser(usage="%prog [options] INPUT_FILE")
     parser.add_option("--data-dir", dest="data_dir", default = "data", help="path to directory containing files (\"Views\").")
     parser.add_option("--skip-file-check", dest="skip_file_check", action="store_true", default = False, help="path to directory containing files (\"Views\").")
+    parser.add_option("--scan-threads", dest="scan_threads", type="int", default = 16, help="number of directories of --data-dir to scan at once.")
+    parser.add_option("--offline", dest="offline", action="store_true", default = False, help="don't contact Drupal; validate against the last downloaded *_index.csv files, and only offer the actions that don't write to Drupal (7, 9 and i).")
+    parser.add_option("--watch", dest="watch", action="store_true", default = False, help="keep running, and re-validate the input files whenever they change or files are added to --data-dir.")
+    parser.add_option("--refresh-interval", dest="refresh_interval", type="int", default = 600, help="in --watch mode, seconds between background refreshes of the Drupal indexes (0 to disable).")
+    parser.add_option("--compress-indexes", dest="compress_indexes", choices=['', 'gz', 'zst'], default = '', help="store the downloaded Drupal indexes compressed (gz or zst).")
+    parser.add_option("--paged-index", dest="paged_indexes", action="append", choices=['item', 'object', 'media', 'name'], default = [], help="download this Drupal index (item, object, media or name) page by page, several pages at once. May be repeated.")
+    parser.add_option("--index-page-size", dest="index_page_size", type="int", default = 0, help="rows per page of the Drupal index views, for --paged-index.")
+    parser.add_option("--index-workers", dest="index_workers", type="int", default = 4, help="number of pages to download at once, for --paged-index.")
+    parser.add_option("--compress-output", dest="compress_output", choices=['', 'gz', 'zst'], default = '', help="compress the CSV files written for review (options 7 and 9) (gz or zst). CSVs for workbench and the Drupal feeds are always uncompressed, as those can't read compressed files.")
     opts, args = parser.parse_args()
 
     if len(args) < 1:
         parser.error("Need at least one input file on command line.")
 
-    return opts.data_dir, opts.skip_file_check, args
+    return opts.data_dir, opts.skip_file_check, args, opts
+
+def open_file(filename, mode = 'r', **kwargs):
+    """
+    Open filename like open(), (de)compressing on the fly if it ends
+    in .gz or .zst.
+    """
+    if filename.endswith('.gz'):
+        if 'b' not in mode:
+            mode += 't'
+        return gzip.open(filename, mode, **kwargs)
+    if filename.endswith('.zst'):
+        try:
+            return zstandard.open(filename, mode, **kwargs)
+        except ImportError:
+            raise CompressionError("Reading or writing {} requires the zstandard package.".format(filename))
+    return open(filename, mode, **kwargs)
+
+def add_compression_extension(filename, compression):
+    if compression:
+        return filename + '.' + compression
+    return filename
+
+@contextlib.contextmanager
+def replace_together(filenames):
+    """
+    Yields the names of partial files, next to each of filenames, to write
+    instead. Only once the block finishes without an error are filenames
+    all replaced with them. A failed download then leaves every previous
+    file untouched, rather than a mix of old and new ones.
+    """
+    partials = []
+    for filename in filenames:
+        directory, name = os.path.split(filename)
+        partials.append(os.path.join(directory, '.partial-' + name))
+    try:
+        yield partials
+    except BaseException:
+        for partial in partials:
+            if os.path.exists(partial):
+                os.remove(partial)
+        raise
+    for partial, filename in zip(partials, filenames):
+        os.replace(partial, filename)
 
 def read_in_dict_file(filename, key_col, val_col, silent = False):
     """
@@ -46,7 +128,7 @@ def read_in_dict_file(filename, key_col, val_col, silent = False):
     """
     data_dict = {}
     key_errors = set()
-    with open(filename, 'r') as f:
+    with open_file(filename, 'r') as f:
         reader = csv.DictReader(f, delimiter=',')
         row_count = 1
         for row in reader:
@@ -74,14 +156,16 @@ def get_draft_items(filename, key_col, val_col, blank_col):
     :return:
     """
     data_dict = {}
-    with open(filename, 'r') as f:
+    with open_file(filename, 'r') as f:
         reader = csv.DictReader(f, delimiter=',')
         for row in reader:
             if not row[blank_col]:
                 data_dict[row[key_col]] = row[val_col]
     return data_dict
 
-def get_drupal_lookups(objects_file, media_file, item_file, name_file, host = ''):
+DrupalLookups = namedtuple('DrupalLookups', ['objects', 'media', 'items', 'drafts', 'names', 'name_drafts', 'object_drafts'])
+
+def get_drupal_lookups(objects_file, media_file, item_file, name_file, host = '', interactive = True):
     if os.path.isfile(objects_file):
         objects, key_errors = read_in_dict_file(objects_file, "field_object_identifier", "node_id")
         if 'blanks' in key_errors:
@@ -120,9 +204,12 @@ def get_drupal_lookups(objects_file, media_file, item_file, name_file, host = ''
 
 
     if len(key_errors) > 0 or len(media_key_errors) > 0 or ('dupes' in item_key_errors) or len(dupes) > 0 or len(name_key_errors) > 0:
-        choice = input("There are errors in the Drupal data. All objects/items/views should have unique identifiers. Would you like to continue anyway? (This may cause further inconsistencies)\n[yes/No]")
-        if choice not in ['yes', 'Yes','Y','y']:
-            raise ValueError("Drupal data contains inconsistencies.")
+        if not interactive:
+            print("WARNING: There are errors in the Drupal data. Continuing anyway.")
+        else:
+            choice = input("There are errors in the Drupal data. All objects/items/views should have unique identifiers. Would you like to continue anyway? (This may cause further inconsistencies)\n[yes/No]")
+            if choice not in ['yes', 'Yes','Y','y']:
+                raise ValueError("Drupal data contains inconsistencies.")
     
     print("Site contains {} objects.".format(len(objects)))
     print("Site contains {} objects missing thumbnails.".format(len(object_drafts)))
@@ -132,7 +219,7 @@ def get_drupal_lookups(objects_file, media_file, item_file, name_file, host = ''
     print("Site contains {} names.".format(len(names)))
     print("Site contains {} draft names.".format(len(name_drafts)))
 
-    return objects, media, items, drafts, names, name_drafts, object_drafts
+    return DrupalLookups(objects, media, items, drafts, names, name_drafts, object_drafts)
 
 
 def read_in_yaml(filename):
@@ -161,38 +248,177 @@ class ValueError(Exception):
     def __init__(self, message):
         self.message = message
 
-def update_csv_indexes(creds):
+class CompressionError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+def fetch_index_page(url, creds, page, retries = 3, timeout = 300):
+    """
+    Get one page of a paged index download, retrying on failure. Client
+    errors (bad credentials, no such view) would fail again, so fail at once.
+    :return: the page's content (bytes), header line included.
+    """
+    for attempt in range(retries):
+        try:
+            response = requests.get(
+                url,
+                params={'page': page},
+                auth=(creds['username'], creds['password']),
+                headers={"Content-Type": "text/csv", "User-Agent": 'Islandora Workbench', "Accept-Encoding": "gzip"},
+                timeout=timeout
+            )
+            if response.status_code == 200:
+                return response.content
+            if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                raise ConnectionError("Page {} of index at {} returned status {}.".format(page, url, response.status_code))
+            print("WARNING: Page {} of {} returned status {}.".format(page, url, response.status_code))
+        except requests.RequestException as err:
+            print("WARNING: Page {} of {} failed: {}".format(page, url, err))
+        if attempt < retries - 1:
+            time.sleep(2 ** attempt)
+    raise ConnectionError("Failed to get page {} of index at {}.".format(page, url))
+
+def download_paged_index(url, creds, filename, page_size, max_workers = 4):
+    """
+    Download an index one view pager page (?page=N) at a time, several pages
+    at once, and write the pages to filename in order. Only a few pages are
+    held in memory at a time. The last page is the first one that is empty,
+    shorter than page_size, or the same as the page before it (Drupal
+    serves the last page again when asked for one past the end).
     """
+    next_page = 0
+    previous = None
+    with open_file(filename, 'wb') as f, concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for next_page in range(max_workers):
+            pending.append(executor.submit(fetch_index_page, url, creds, next_page))
+        page = 0
+        while pending:
+            content = pending.popleft().result()
+            header, _, body = content.partition(b'\n')
+            if page == 0:
+                f.write(header + b'\n')
+            if body.strip() == b'' or content == previous:
+                break
+            if not body.endswith(b'\n'):
+                body += b'\n'
+            f.write(body)
+            previous = content
+            page += 1
+            row_count = sum(1 for x in csv.reader(io.StringIO(body.decode('utf-8', 'replace'))))
+            if row_count < page_size:
+                break
+            next_page += 1
+            pending.append(executor.submit(fetch_index_page, url, creds, next_page))
+        for future in pending:
+            future.cancel()
+    print("Downloaded {} pages of {}.".format(page, url))
 
+def update_csv_indexes(creds, compression = '', paged_types = None, page_size = 0, max_workers = 4):
+    """
+    Download the Drupal indexes, streaming them to disk. The index files
+    are only replaced once all of them have been downloaded.
     :param creds: workbench credentials dictionary containing username, password, host
-    :return:
+    :param compression: '', 'gz' or 'zst'; how to store the index files.
+    :param paged_types: indexes to download page by page (see download_paged_index).
+    :param page_size: number of rows per page in the Drupal view of a paged index.
+    :param max_workers: number of pages of a paged index to download at once.
+    :return: filenames of the object, media, item and name indexes.
     """
     types = ['item','object','media','name']
-    for type in types:
-        url = creds['host']  + '/' + type + '-index/download'
-        response = requests.get(
-            url,
-            auth=(creds['username'], creds['password']),
-            headers={"Content-Type": "text/csv", "User-Agent": 'Islandora Workbench'}
-        )
-        if response.status_code == 200:
-            with open(type + '_index.csv', 'w') as f:
-                f.write(response.text)
-        else:
-            raise ConnectionError("Failed to get {} index at {}.".format(type, url))
-    return "object_index.csv", "media_index.csv", "item_index.csv", "name_index.csv"
+    filenames = [add_compression_extension(type + '_index.csv', compression) for type in types]
+    with replace_together(filenames) as partials:
+        for type, partial in zip(types, partials):
+            url = creds['host']  + '/' + type + '-index/download'
+            if paged_types and type in paged_types:
+                download_paged_index(url, creds, partial, page_size, max_workers)
+                continue
+            try:
+                response = requests.get(
+                    url,
+                    auth=(creds['username'], creds['password']),
+                    headers={"Content-Type": "text/csv", "User-Agent": 'Islandora Workbench', "Accept-Encoding": "gzip"},
+                    stream=True
+                )
+                if response.status_code == 200:
+                    with response, open_file(partial, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=1024 * 1024):
+                            f.write(chunk)
+                else:
+                    response.close()
+                    raise ConnectionError("Failed to get {} index at {}.".format(type, url))
+            except requests.RequestException as err:
+                raise ConnectionError("Failed to get {} index at {}: {}".format(type, url, err))
+    return tuple(add_compression_extension(type + '_index.csv', compression) for type in ['object', 'media', 'item', 'name'])
 
 
 def get_type_config(type):
     config_file = sys.path[0] + os.sep + 'conf' + os.sep + type + '.yml'
     return read_in_yaml(config_file)
 
+@functools.lru_cache(maxsize=None)
 def validate_edtf_date(date):
-    valid = edtf_validate.valid_edtf.is_valid(date.strip())
+    # EDTF parsing is slow, and spreadsheets repeat the same dates many times.
+    valid = valid_edtf.is_valid(date.strip())
     return valid
 
+class ColumnPool(object):
+    """
+    Lets all rows with the same value in a low-cardinality column (COLLECTION,
+    LOCATION, ...) share one string object instead of each Row keeping its
+    own copy. Listed columns are always pooled. With auto_detect, any other
+    column is pooled until it has more than max_distinct different values.
+    Savings are counted per pass (see reset_counts): the first row with each
+    value in a pass would need its copy anyway, pooled or not.
+    """
+    def __init__(self, columns = None, auto_detect = False, max_distinct = 1000):
+        self.fixed = set(columns or [])
+        self.pools = dict((column, {}) for column in self.fixed)
+        self.rejected = set()
+        self.auto_detect = auto_detect
+        self.max_distinct = max_distinct
+        self.reset_counts()
+
+    def reset_counts(self):
+        """Start a new pass over the spreadsheets; the pools are kept."""
+        self.bytes_saved = 0
+        self.bytes_saved_by_column = {}
+        self.seen = {}
+
+    def encode(self, row):
+        for key, value in row.items():
+            # Empty and one-character strings are already shared by Python.
+            if len(value) < 2 or key in self.rejected:
+                continue
+            pool = self.pools.get(key)
+            if pool is None:
+                if not self.auto_detect:
+                    continue
+                pool = self.pools[key] = {}
+            shared = pool.get(value)
+            if shared is None:
+                if len(pool) >= self.max_distinct and key not in self.fixed:
+                    self.rejected.add(key)
+                    del self.pools[key]
+                    self.seen.pop(key, None)
+                    continue
+                pool[value] = shared = value
+            seen = self.seen.setdefault(key, set())
+            if shared is not value:
+                row[key] = shared
+                if shared in seen:
+                    size = sys.getsizeof(value)
+                    self.bytes_saved += size
+                    self.bytes_saved_by_column[key] = self.bytes_saved_by_column.get(key, 0) + size
+            seen.add(shared)
+
+    def pooled_columns(self):
+        """Columns in which sharing values actually saved memory."""
+        return sorted(x for x in self.bytes_saved_by_column.keys() if x is not None and x in self.pools)
+
+
 class Row(object):
-    def __init__(self, row, row_id):
+    def __init__(self, row, row_id, column_pool = None):
         self.id = False
         self.id_in_drupal = False
         self.is_draft = False
@@ -205,6 +431,8 @@ class Row(object):
         self.row_number = row_id
         for key in self.row:
             self.row[key] = self.row[key].strip()
+        if column_pool is not None:
+            column_pool.encode(self.row)
         self.blank = '' # Hack for workbench needing a 'file' column
 
     def __str__(self):
@@ -240,17 +468,15 @@ class Row(object):
         if self.parent in things_in_drupal.keys():
             self.parent_id_in_drupal = things_in_drupal[self.parent]
 
-    def check_for_thumbnail(self, media):
+    def check_for_thumbnail(self, media, thumbnail_cache = None):
         if self.row['FILENAME'] in media.keys():
             self.thumbnail_mid = media[self.row["FILENAME"]]
             return True
         elif len(self.row['FILENAME']) > 3:
-            # Remove extension if present
-            (root, ext) = os.path.splitext(self.row["FILENAME"])
-            if len(ext) > 4: # That's not a file extension, that's a file name with a period in it.
-              root = self.row["FILENAME"]
-
-            matches = [media[x] for x in media.keys() if x.startswith(root)]
+            if thumbnail_cache is not None:
+                matches = thumbnail_cache.matches(self.row["FILENAME"], media)
+            else:
+                matches = find_thumbnails(self.row["FILENAME"], media)
             if len(matches) == 1:
                 self.thumbnail_mid = matches[0]
                 return True
@@ -276,8 +502,8 @@ class Row(object):
 
 
 class Object(Row):
-    def __init__(self, row, row_id = None):
-        super().__init__(row, row_id)
+    def __init__(self, row, row_id = None, column_pool = None):
+        super().__init__(row, row_id, column_pool)
         self.id = self.row["OBJECT"]
         self.row['id'] = self.id
 
@@ -326,8 +552,8 @@ class Object(Row):
 
 
 class Item(Row):
-    def __init__(self, row, row_id = None):
-        super().__init__(row, row_id)
+    def __init__(self, row, row_id = None, column_pool = None):
+        super().__init__(row, row_id, column_pool)
         self.id = self.row["ITEM"]
         self.row['id'] = self.id
 
@@ -365,9 +591,10 @@ class Item(Row):
 
 
 class View(Row):
-    def __init__(self, row, row_id = None):
-        super().__init__(row, row_id)
+    def __init__(self, row, row_id = None, column_pool = None):
+        super().__init__(row, row_id, column_pool)
         self.id = self.row["FILENAME"]
+        self.path = self.id # Path of the file relative to the data directory.
         self.has_file = False
         if self.id == '':
             print("ERROR: Line {}. View requires a filename".format(self.row_number))
@@ -392,18 +619,124 @@ class View(Row):
         self.id = self.row["FILENAME"]
 
     def check_for_file(self, files):
-        if self.row['FILENAME'] in files:
-            self.has_file = True
+        """
+        :param files: DataDirListing of the data directory.
+        """
+        if self.row['FILENAME'] in files.entries:
+            matches = [self.row['FILENAME']]
         else:
+            matches = files.by_name.get(self.row['FILENAME'], [])
+        if len(matches) == 0:
             # Remove extension
-            root = os.path.splitext(self.row["FILENAME"])[0]
-            matches = [ x for x in files if x.startswith(root) ]
-            if len(matches) == 1:
-                self.row["FILENAME"] = self.id = matches[0]
-                self.has_file = True
-            elif len(matches) > 1:
-                self.value_issues = True
-                print("ERROR: Row {}. Multiple matching files found in data dir: {} ".format(str(self.row_number),str(matches)))
+            directory, name = os.path.split(self.row["FILENAME"])
+            root = os.path.splitext(name)[0]
+            matches = files.paths_starting_with(root)
+            if directory:
+                # Only look in the directory FILENAME names.
+                directory = os.path.normpath(directory) + os.sep
+                matches = [x for x in matches if x.startswith(directory)]
+        if len(matches) == 1:
+            self.path = matches[0]
+            self.row["FILENAME"] = self.id = os.path.basename(matches[0])
+            self.has_file = True
+        elif len(matches) > 1:
+            self.value_issues = True
+            print("ERROR: Row {}. Multiple matching files found in data dir: {} ".format(str(self.row_number),str(matches)))
+
+class DataDirListing(object):
+    """
+    Files found under the data directory, as paths relative to it, with
+    their size and modification time. Also keeps the modification time of
+    each directory scanned, to tell when files have been added or removed.
+    """
+    def __init__(self, entries, directories = None, seconds = 0):
+        self.entries = entries
+        self.directories = directories or {}
+        self.directory_count = len(self.directories)
+        self.seconds = seconds
+        self.by_name = {}
+        # Sorted, so that the order the directories were scanned in doesn't show.
+        for path in sorted(entries):
+            self.by_name.setdefault(os.path.basename(path), []).append(path)
+        self.names = sorted(self.by_name.keys())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def paths_starting_with(self, root):
+        """Paths of files whose name (without directory) starts with root."""
+        paths = []
+        position = bisect.bisect_left(self.names, root)
+        while position < len(self.names) and self.names[position].startswith(root):
+            paths.extend(self.by_name[self.names[position]])
+            position += 1
+        return sorted(paths)
+
+    def total_size(self):
+        return sum(size for size, mtime in self.entries.values())
+
+    def changed(self, max_workers = 16):
+        """
+        Whether any scanned directory has been modified, or removed, since
+        the scan. Directories are checked concurrently, like scan_data_dir.
+        """
+        def directory_changed(path, mtime):
+            try:
+                return os.stat(path).st_mtime_ns != mtime
+            except OSError:
+                return True
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return any(executor.map(directory_changed, self.directories.keys(), self.directories.values()))
+
+
+def scan_directory(path, relative_path):
+    files = {}
+    subdirectories = []
+    # Taken before listing, so changes made during the listing are noticed later.
+    mtime = os.stat(path).st_mtime_ns
+    with os.scandir(path) as it:
+        for entry in it:
+            entry_path = os.path.join(relative_path, entry.name) if relative_path else entry.name
+            try:
+                if entry.is_dir():
+                    subdirectories.append((entry.path, entry_path))
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files[entry_path] = (stat.st_size, stat.st_mtime)
+            except OSError as err:
+                print("WARNING: Could not read {}: {}".format(entry.path, err))
+    return path, mtime, files, subdirectories
+
+def scan_data_dir(data_dir, max_workers = 16):
+    """
+    List all files under data_dir, including subdirectories, scanning
+    directories concurrently (listing is slow on network mounts).
+    :return: DataDirListing
+    """
+    started = time.perf_counter()
+    entries = {}
+    directories = {}
+    seen = set([os.path.realpath(data_dir)])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set([executor.submit(scan_directory, data_dir, '')])
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    path, mtime, files, subdirectories = future.result()
+                except OSError as err:
+                    print("WARNING: Could not read directory: {}".format(err))
+                    continue
+                directories[path] = mtime
+                entries.update(files)
+                for path, relative_path in subdirectories:
+                    # Symlinked directories could loop.
+                    real_path = os.path.realpath(path)
+                    if real_path not in seen:
+                        seen.add(real_path)
+                        pending.add(executor.submit(scan_directory, path, relative_path))
+    return DataDirListing(entries, directories, time.perf_counter() - started)
+
 
 class Name(Row):
     def __init__(self, row, row_id):
@@ -438,8 +771,63 @@ class Name(Row):
         return values
 
 
+def find_thumbnails(filename, media):
+    """
+    Media ids of the thumbnails in Drupal whose names start with filename,
+    less its extension. Scans the whole media index.
+    """
+    # Remove extension if present
+    (root, ext) = os.path.splitext(filename)
+    if len(ext) > 4: # That's not a file extension, that's a file name with a period in it.
+      root = filename
+    return [media[x] for x in media.keys() if x.startswith(root)]
+
+
+class ThumbnailCache(object):
+    """
+    Remembers find_thumbnails results by FILENAME, so that in --watch mode
+    the media index is only scanned for file names not seen on an earlier
+    pass. Must be cleared when the media index changes.
+    """
+    def __init__(self):
+        self.results = {}
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.results = {}
+
+    def start_pass(self):
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+
+    def prune(self):
+        """Forget file names that were not seen in the last pass."""
+        self.results = dict((filename, self.results[filename]) for filename in self.seen if filename in self.results)
+
+    def matches(self, filename, media):
+        self.seen.add(filename)
+        if filename in self.results:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.results[filename] = find_thumbnails(filename, media)
+        return self.results[filename]
+
+
+def validate_row_fields(this_row, media = None, thumbnail_cache = None):
+    """
+    Run the row-local checks on this_row.
+    """
+    this_row.validate_fields()
+    if media is not None:
+        this_row.check_for_thumbnail(media, thumbnail_cache)
+
+
 class Analysis(object):
-    def __init__(self, objects, items, views, names):
+    def __init__(self, objects, items, views, names, column_pool = None):
         self.object_count_total = len(objects.values())
         self.item_count_total = len(items.values())
         self.view_count_total = len(views.values())
@@ -466,6 +854,9 @@ class Analysis(object):
         self.new_objects_with_items = len(set([ x.parent for x in views.values() if x.has_file and x.parent in new_objects ]))
         self.new_views_for_existing_objects = len([ x for x in views.values() if x.has_file and x.parent_id_in_drupal != False and not x.id_in_drupal ])
 
+        self.pooled_columns = column_pool.pooled_columns() if column_pool else []
+        self.pooled_bytes_saved = column_pool.bytes_saved if column_pool else 0
+
 def print_report(stats):
 
     print("Total objects in spreadsheet: {}".format(stats.object_count_total))
@@ -494,10 +885,171 @@ def print_report(stats):
     print("Objects in Drupal needing updates (thumbnails): {} objects".format(stats.objects_for_thumbs))
     print("Items in Drupal, needing updates (identifier): {} items".format(stats.item_existing_drafts))
 
+    if stats.pooled_bytes_saved > 0:
+        print("Memory saved by sharing repeated values in {} columns: {:,.1f} KB".format(len(stats.pooled_columns), stats.pooled_bytes_saved / 1000))
+
+
+class InvestigateIndex(object):
+    """
+    Lookup tables over the ingested objects, items and views, so the
+    investigate console can answer queries without scanning every row.
+    Records are referred to by their position in self.records. Titles are
+    normalised once and kept end to end in one string, self.titles, so a
+    title search is a str.find over it rather than a loop over the records;
+    self.title_offsets[position] is where each record's title starts.
+    """
+    def __init__(self, objects, items, views):
+        self.records = []
+        titles = []
+        self.by_id = {}
+        self.by_drupal_id = {}
+        self.children = {}
+        for kind, records in (('object', objects), ('item', items), ('view', views)):
+            for record in records.values():
+                position = len(self.records)
+                self.records.append((kind, record))
+                self.by_id.setdefault(record.id, []).append(position)
+                if record.id_in_drupal:
+                    self.by_drupal_id.setdefault(str(record.id_in_drupal), []).append(position)
+                if record.parent:
+                    self.children.setdefault((kind, record.parent), []).append(position)
+                titles.append(self.normalise(record.row.get('TITLE', '')))
+        self.sorted_ids = sorted(self.by_id.keys())
+        # Newlines can't be in a normalised needle, so matches never span titles.
+        self.titles = '\n'.join(titles)
+        self.title_offsets = []
+        offset = 0
+        for title in titles:
+            self.title_offsets.append(offset)
+            offset += len(title) + 1
+        self.title_offsets.append(offset)
+
+    @staticmethod
+    def normalise(text):
+        return ' '.join(text.lower().split())
+
+
+    def exact(self, needle):
+        return self.by_id.get(needle, [])
+
+    def prefix(self, needle):
+        matches = []
+        position = bisect.bisect_left(self.sorted_ids, needle)
+        while position < len(self.sorted_ids) and self.sorted_ids[position].startswith(needle):
+            matches.extend(self.by_id[self.sorted_ids[position]])
+            position += 1
+        return matches
+
+    def title(self, needle, limit = None):
+        """
+        Records whose title contains needle, in order, stopping after limit
+        matches.
+        """
+        needle = self.normalise(needle)
+        matches = []
+        start = 0
+        while needle and len(matches) != limit:
+            found = self.titles.find(needle, start)
+            if found == -1:
+                break
+            position = bisect.bisect_right(self.title_offsets, found) - 1
+            matches.append(position)
+            # Carry on from the next title.
+            start = self.title_offsets[position + 1]
+        return matches
+
+    def drupal(self, needle):
+        return self.by_drupal_id.get(needle, [])
+
+    def links(self, position):
+        """
+        Records linked to this one: its children (objects of an item, views of
+        an object) and its parent.
+        """
+        kind, record = self.records[position]
+        # Objects point at their item, views at their object.
+        child_kind = {'item': 'object', 'object': 'view'}.get(kind)
+        parent_kind = {'object': 'item', 'view': 'object'}.get(kind)
+        children = self.children.get((child_kind, record.id), []) if child_kind else []
+        parents = [x for x in self.by_id.get(record.parent, []) if self.records[x][0] == parent_kind] if record.parent else []
+        return parents, children
+
+
+def investigate(objects, items, views, max_results = 20):
+    """
+    Interactive console for looking up records by id, id prefix, title words
+    or Drupal id, and following the links between items, objects and views.
+    """
+    started = time.perf_counter()
+    index = InvestigateIndex(objects, items, views)
+    print("Indexed {} records in {:.2f}s.".format(len(index.records), time.perf_counter() - started))
+    usage = [
+        "  <id>              show the object, item or view with this exact id",
+        "  prefix <text>     records whose id starts with text",
+        "  title <text>      records whose title contains text",
+        "  drupal <id>       records with this node, term or media id in Drupal",
+        "  links <id>        parents and children of the record with this id",
+        "  <enter> to exit.",
+    ]
+
+    def describe(position):
+        kind, record = index.records[position]
+        return "  {:<7} {}  {}".format(kind, record.id, record.row.get('TITLE', ''))
+
+    def show(positions, complete = True):
+        for position in positions[:max_results]:
+            print(describe(position))
+        if len(positions) > max_results and complete:
+            print("  ... and {} more.".format(len(positions) - max_results))
+        elif len(positions) > max_results:
+            print("  ... and more.")
+        if len(positions) == 0:
+            print("  No matches.")
+
+    for line in usage:
+        print(line)
+    while True:
+        try:
+            query = input("Investigate> ").strip()
+        except EOFError:
+            break
+        if query == '':
+            break
+        command, _, argument = query.partition(' ')
+        argument = argument.strip()
+        started = time.perf_counter()
+        if command == 'prefix' and argument:
+            show(index.prefix(argument))
+        elif command == 'title' and argument:
+            show(index.title(argument, max_results + 1), complete=False)
+        elif command == 'drupal' and argument:
+            show(index.drupal(argument))
+        elif command == 'links' and argument:
+            positions = index.exact(argument)
+            for position in positions:
+                parents, children = index.links(position)
+                print(describe(position))
+                print(" parent:")
+                show(parents)
+                print(" children:")
+                show(children)
+            if len(positions) == 0:
+                print("  No matches.")
+        elif command in ('help', '?'):
+            for line in usage:
+                print(line)
+        else:
+            positions = index.exact(query)
+            for position in positions:
+                print(index.records[position][1].values())
+            if len(positions) == 0:
+                print("  No record with id [{}]. Try 'prefix {}' or 'title {}'.".format(query, query, query))
+        print("  ({:.1f} ms)".format((time.perf_counter() - started) * 1000))
+
 
 def output_objects_as_csv(filename, object_list, field_config):
     # Write CSV
-    with open(filename, 'w') as f:
+    with open_file(filename, 'w') as f:
         writer = csv.DictWriter(f, fieldnames = field_config, extrasaction='ignore')
         writer.writerow(field_config)
         for obj in object_list:
@@ -524,7 +1076,7 @@ def prepare_objects_with_views(all_objects, views, new_objects = True, only_avai
             children = [ x for x in views.values() if x.parent == obj.id and x.has_file and not x.id_in_drupal]
         else:
             children = [ x for x in views.values() if x.parent == obj.id and not x.id_in_drupal ]
-        my_views = [ child.id for child in children ]
+        my_views = [ child.path for child in children ]
         if len(my_views) > 0:
             objects.append(obj)
         diff = max_view_count-len(my_views)
@@ -573,6 +1125,91 @@ def extract_names(row, name_fields):
     return names
 
 
+def get_name_parts(name):
+    """
+    Normalise a name for near-duplicate comparison: strip accents,
+    punctuation, case and extra whitespace, then split into a surname and a
+    list of given-name tokens. "Smith, J." and "John Smith" both have
+    surname "smith".
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+    name = ''.join(c if (c.isalnum() or c == ',') else ' ' for c in name)
+    if ',' in name:
+        surname, _, given = name.partition(',')
+        surname = ' '.join(surname.split())
+        given = given.replace(',', ' ').split()
+    else:
+        tokens = name.split()
+        if len(tokens) == 0:
+            return '', []
+        surname = tokens[-1]
+        given = tokens[:-1]
+    return surname, given
+
+def given_names_compatible(given_a, given_b):
+    # Initials match full names ("j" ~ "john"); missing middle names are allowed.
+    for a, b in zip(given_a, given_b):
+        if not (a.startswith(b) or b.startswith(a)):
+            return False
+    return True
+
+def find_near_duplicate_names(spreadsheet_names, drupal_names):
+    """
+    Group names that are probably the same person or body spelled
+    differently. Names are only compared with others in the same block
+    (same normalised surname and first initial), so this scales with the
+    number of names rather than the number of pairs.
+    :param spreadsheet_names: names from the spreadsheet.
+    :param drupal_names: names already in Drupal.
+    :return: list of clusters (sorted lists of names), each containing at
+    least one spreadsheet name.
+    """
+    all_names = set(spreadsheet_names).union(drupal_names)
+    blocks = {}
+    parts = {}
+    for name in all_names:
+        surname, given = parts[name] = get_name_parts(name)
+        if surname == '':
+            continue
+        blocks.setdefault((surname, given[0][0] if given else ''), []).append(name)
+
+    parent = {}
+    def find(name):
+        while parent.get(name, name) != name:
+            name = parent[name]
+        return name
+
+    for block in blocks.values():
+        for i in range(len(block)):
+            for j in range(i + 1, len(block)):
+                if given_names_compatible(parts[block[i]][1], parts[block[j]][1]):
+                    root_i, root_j = find(block[i]), find(block[j])
+                    if root_i != root_j:
+                        parent[root_j] = root_i
+
+    clusters = {}
+    for name in parent.keys():
+        clusters.setdefault(find(name), set()).add(name)
+    for root in list(clusters.keys()):
+        clusters[root].add(root)
+    return sorted(sorted(x) for x in clusters.values() if not x.isdisjoint(spreadsheet_names))
+
+def output_name_clusters(filename, clusters, names, names_in_drupal):
+    with open_file(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['cluster', 'NAME', 'SORT KEY', 'source', 'term_id'])
+        for number, cluster in enumerate(clusters, 1):
+            for name in cluster:
+                if name in names and name in names_in_drupal:
+                    source = 'spreadsheet and drupal'
+                elif name in names:
+                    source = 'spreadsheet'
+                else:
+                    source = 'drupal'
+                sort_key = names[name].row['SORT KEY'] if name in names else ''
+                writer.writerow([number, name, sort_key, source, names_in_drupal.get(name, '')])
+
 def output_workbench_config(filename, task, input_csv, input_dir, additional_files = None, **options):
     write_workbench_config(filename, task, input_csv, input_dir, additional_files, **options)
     print("Use the following argument for workbench:\n  --config {} --check\n".format( os.path.abspath(filename)))
@@ -591,35 +1228,252 @@ def write_workbench_config(filename, task, input_csv, input_dir, additional_file
     with(open(filename, 'w')) as f:
         doc = yaml.dump(data,f, sort_keys = False, default_style = '"')
 
+def ingest_input_files(input_filenames, lookups, name_fields, files_in_dir, skip_file_check, thumbnail_cache = None, column_pool = None):
+    """
+    Read and validate every row of the input spreadsheets against the
+    Drupal lookups.
+    :param input_filenames: spreadsheet csv files, read in order.
+    :param lookups: DrupalLookups, as returned by get_drupal_lookups.
+    :param name_fields: contents of conf/name.yml
+    :param files_in_dir: DataDirListing of the files available in the data directory.
+    :param skip_file_check:
+    :param thumbnail_cache: optional ThumbnailCache, to skip re-matching thumbnails.
+    :param column_pool: optional ColumnPool, to share repeated column values.
+    :return: objects, items, views, names, total_rows_processed
+    """
+    objects = {}
+    items = {}
+    views = {}
+    names = {}
+
+    total_rows_processed = 0
+
+    for input_filename in input_filenames:
+        with open_file(input_filename, 'r' , encoding='utf-8-sig') as input_file:
+            print("\nReading in from file: {}".format(input_filename))
+            reader = csv.DictReader(input_file, delimiter = ',')
+            row_counter = 1
+            for row in reader:
+                row_counter += 1
+                row_type = row['TYPE'].lower().strip()
+                if row_type == 'view':
+                    this_row = View(row, row_counter, column_pool)
+                    this_row.validate_structure(objects, items)
+                    validate_row_fields(this_row)
+                    if this_row.value_issues or this_row.structural_issues:
+                        continue
+                    if not skip_file_check:
+                        this_row.check_for_file(files_in_dir)
+                    this_row.check_for_self_in_drupal(lookups.media)
+                    this_row.check_for_parent_in_drupal(lookups.objects)
+                    if this_row.id in views and views[this_row.id].path != this_row.path:
+                        # Views (and Drupal media) are identified by file name alone.
+                        other = views[this_row.id]
+                        print("ERROR: Line {}. View file {} has the same name as {} (line {}). Rename one of them; neither will be uploaded.".format(row_counter, this_row.path, other.path, other.row_number))
+                        other.value_issues = True
+                        other.has_file = False
+                        continue
+                    views[this_row.id] = this_row
+
+                elif row_type == 'item':
+                    this_row = Item(row, row_counter, column_pool)
+                    this_row.validate_structure(objects, items)
+                    validate_row_fields(this_row, lookups.media, thumbnail_cache)
+                    this_row.check_for_self_in_drupal(lookups.items)
+                    this_row.check_for_self_in_drafts(lookups.drafts)
+                    items[this_row.id] = this_row
+
+                elif row_type == 'object':
+                    this_row = Object(row, row_counter, column_pool)
+                    this_row.validate_structure(objects, items)
+                    validate_row_fields(this_row, lookups.media, thumbnail_cache)
+                    this_row.check_for_self_in_drupal(lookups.objects)
+                    this_row.check_for_self_in_drafts(lookups.object_drafts)
+                    this_row.check_for_parent_in_drupal(lookups.items)
+                    objects[this_row.id] = this_row
+                else:
+                    print("WARNING: unknown row type: [{}] on line [{}]. Skipping row.".format(row_type, row_counter))
+                names_from_this_row = extract_names(row, name_fields)
+                for name in names_from_this_row.keys():
+                    this_name = Name({'NAME': name,'SORT KEY': names_from_this_row[name]},row_counter)
+                    this_name.check_for_self_in_drupal(lookups.names)
+                    this_name.check_for_self_in_drafts(lookups.name_drafts)
+                    this_name.validate_structure(names)
+                    names[this_name.id] = this_name
+
+        total_rows_processed += row_counter
+
+    return objects, items, views, names, total_rows_processed
+
+def find_latest_index_files():
+    """
+    The most recently downloaded object, media, item and name index files,
+    compressed or not, or None if any of them has never been downloaded.
+    """
+    filenames = []
+    for type in ['object', 'media', 'item', 'name']:
+        candidates = [add_compression_extension(type + '_index.csv', x) for x in ['', 'gz', 'zst']]
+        candidates = [x for x in candidates if os.path.isfile(x)]
+        if len(candidates) == 0:
+            return None
+        filenames.append(max(candidates, key=os.path.getmtime))
+    return filenames
+
+def load_offline_drupal_lookups():
+    """
+    Drupal lookups from the index files left by the last online run. If there
+    are none, empty lookups, so only the spreadsheet's own structure and
+    fields are checked.
+    """
+    filenames = find_latest_index_files()
+    if filenames is None:
+        print("WARNING: No downloaded Drupal indexes found. Checking the spreadsheet alone; every row will count as new.")
+        return DrupalLookups({}, {}, {}, {}, {}, {}, {})
+    downloaded = datetime.datetime.fromtimestamp(min(os.path.getmtime(x) for x in filenames))
+    print("Using Drupal indexes downloaded {}: {}".format(downloaded.strftime('%Y-%m-%d %H:%M'), ', '.join(filenames)))
+    return get_drupal_lookups(*filenames)
+
+def refresh_drupal_lookups(creds, interactive = True, **download_options):
+    object_index_filename, media_index_filename, item_index_filename, name_index_filename = update_csv_indexes(creds, **download_options)
+    return get_drupal_lookups(object_index_filename, media_index_filename, item_index_filename, name_index_filename, creds['host'], interactive)
+
+def get_modification_times(filenames):
+    mtimes = []
+    for filename in filenames:
+        try:
+            mtimes.append(os.stat(filename).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+def watch_input_files(input_filenames, lookups, name_fields, files_in_dir, skip_file_check, creds = None, refresh_interval = 0, poll_interval = 0.5, download_options = None, column_pool = None, data_dir = None, scan_threads = 16, rescan_interval = 5):
+    """
+    Keep the Drupal lookups and validation results in memory, and re-run
+    the ingest and report whenever an input file changes. Thumbnail matches
+    and date checks are kept between passes. If refresh_interval is set,
+    the Drupal indexes are re-downloaded in the background every
+    refresh_interval seconds. Every rescan_interval seconds, the data
+    directory is checked in the background, and re-scanned if files were
+    added to or removed from it. Stops on Ctrl-C.
+    :return: objects, items, views, names, total_rows_processed, stats, lookups
+    """
+    thumbnail_cache = ThumbnailCache()
+    lock = threading.Lock()
+    state = {'lookups': lookups, 'refreshed': False, 'files_in_dir': files_in_dir, 'rescanned': False}
+    stop = threading.Event()
+
+    def refresh_periodically():
+        while not stop.wait(refresh_interval):
+            try:
+                new_lookups = refresh_drupal_lookups(creds, interactive=False, **(download_options or {}))
+            except (ConnectionError, FileNotFoundError, requests.RequestException) as err:
+                print("WARNING: Could not refresh Drupal indexes, keeping the previous ones. {}".format(err))
+                continue
+            with lock:
+                state['lookups'] = new_lookups
+                state['refreshed'] = True
+
+    def rescan_periodically():
+        listing = files_in_dir
+        while not stop.wait(rescan_interval):
+            try:
+                if not listing.changed(scan_threads):
+                    continue
+                listing = scan_data_dir(data_dir, scan_threads)
+            except OSError as err:
+                print("WARNING: Could not re-scan the data directory. {}".format(err))
+                continue
+            print("\nData directory changed. It now contains {} files.".format(len(listing)))
+            with lock:
+                state['files_in_dir'] = listing
+                state['rescanned'] = True
+
+    if creds and refresh_interval > 0:
+        threading.Thread(target=refresh_periodically, daemon=True).start()
+    if files_in_dir is not None and rescan_interval > 0:
+        threading.Thread(target=rescan_periodically, daemon=True).start()
+
+    results = None
+    last_mtimes = None
+    try:
+        while True:
+            mtimes = get_modification_times(input_filenames)
+            with lock:
+                lookups = state['lookups']
+                refreshed = state['refreshed']
+                state['refreshed'] = False
+                files_in_dir = state['files_in_dir']
+                rescanned = state['rescanned']
+                state['rescanned'] = False
+            if refreshed:
+                # Thumbnail matches depend on the media index.
+                thumbnail_cache.clear()
+            if None not in mtimes and (mtimes != last_mtimes or refreshed or rescanned):
+                last_mtimes = mtimes
+                started = time.perf_counter()
+                thumbnail_cache.start_pass()
+                if column_pool is not None:
+                    column_pool.reset_counts()
+                try:
+                    objects, items, views, names, total_rows_processed = ingest_input_files(input_filenames, lookups, name_fields, files_in_dir, skip_file_check, thumbnail_cache, column_pool)
+                except (csv.Error, KeyError, OSError) as err:
+                    # Probably caught the file mid-save; it will be re-read on the next change.
+                    print("WARNING: Could not read input files: {}".format(err))
+                else:
+                    thumbnail_cache.prune()
+                    print("\nAssessing results from input files.\n")
+                    print("Total rows: {}".format(total_rows_processed))
+                    stats = Analysis(objects, items, views, names, column_pool)
+                    print_report(stats)
+                    results = (objects, items, views, names, total_rows_processed, stats)
+                    print("\nRe-validated in {:.2f}s ({} thumbnail lookups reused, {} new).".format(time.perf_counter() - started, thumbnail_cache.hits, thumbnail_cache.misses))
+                print("Watching {} for changes. Press Ctrl-C to stop and choose an action.".format(', '.join(input_filenames)))
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("")
+    finally:
+        stop.set()
+
+    if results is None:
+        exit(1)
+    return results + (lookups,)
+
 def main():
-    data_dir, skip_file_check, input_filenames = parse_cmd_line()
+    data_dir, skip_file_check, input_filenames, opts = parse_cmd_line()
 
     # List of files in data-dir
-    files_in_dir = []
+    files_in_dir = None
     if not skip_file_check:
         print("Checking for files in data directory.")
         if not os.path.isdir(data_dir):
             print("WARNING: Data directory not available. Provide the path to the files in the --data-dir parameter. It will not be possible to create configurations to upload files. ")
             skip_file_check = True
         else:
-            files_in_dir = os.listdir(data_dir)
-            print("OK: data directory contains {} files.\n".format(len(files_in_dir)))
+            files_in_dir = scan_data_dir(data_dir, opts.scan_threads)
+            print("OK: data directory contains {} files ({:.1f} GB) in {} directories. Scanned in {:.1f}s.\n".format(len(files_in_dir), files_in_dir.total_size() / 1e9, files_in_dir.directory_count, files_in_dir.seconds))
 
 
 
-    # TODO: make optional, to process structure of file alone.
     # Get data about existing objects, media, names, and items.
+    download_options = {'compression': opts.compress_indexes, 'paged_types': opts.paged_indexes, 'page_size': opts.index_page_size, 'max_workers': opts.index_workers}
     try:
-        print("Validating items, objects and views in Drupal.")
-        creds = get_workbench_creds()
+        if opts.offline:
+            print("Validating items, objects and views against the last downloaded Drupal indexes (offline).")
+            creds = None
+            lookups = load_offline_drupal_lookups()
+        else:
+            print("Validating items, objects and views in Drupal.")
+            creds = get_workbench_creds()
 
-        # TODO: refactor this to use JSON instead of writing to CSV files.
-        object_index_filename, media_index_filename, item_index_filename, name_index_filename = update_csv_indexes(creds)
-        objects_in_drupal, media_in_drupal, items_in_drupal, drafts_in_drupal, names_in_drupal, name_drafts_in_drupal, objects_missing_thumbs = get_drupal_lookups(object_index_filename, media_index_filename, item_index_filename, name_index_filename, creds['host'])
+            # TODO: refactor this to use JSON instead of writing to CSV files.
+            lookups = refresh_drupal_lookups(creds, **download_options)
 
     except yaml.YAMLError:
         print("ERROR: Credentials in conf/credentials.yml is not valid YAML.")
         exit(1)
+    except CompressionError as err:
+        print("ERROR: {}".format(err))
+        exit(1)
     except InputError as err:
         print("ERROR: {}".format(err))
         print("Please ensure your drupal credentials are in conf/credentials.yml.")
@@ -631,70 +1485,24 @@ def main():
         print("ERROR: {}".format(err))
         exit(1)
     else:
-        objects = {}
-        items = {}
-        views = {}
-        names = {}
         name_fields = read_in_yaml('conf' + os.sep + 'name.yml')
+        column_pool = ColumnPool(**get_type_config('pooled_columns'))
 
-        total_rows_processed = 0
-
-        for input_filename in input_filenames:
-            with open(input_filename, 'r' , encoding='utf-8-sig') as input_file:
-                print("\nReading in from file: {}".format(input_filename))
-                reader = csv.DictReader(input_file, delimiter = ',')
-                row_counter = 1
-                for row in reader:
-                    row_counter += 1
-                    row_type = row['TYPE'].lower().strip()
-                    if row_type == 'view':
-                        this_row = View(row, row_counter)
-                        this_row.validate_structure(objects, items)
-                        this_row.validate_fields()
-                        if this_row.value_issues or this_row.structural_issues:
-                            continue
-                        if not skip_file_check:
-                            this_row.check_for_file(files_in_dir)
-                        this_row.check_for_self_in_drupal(media_in_drupal)
-                        this_row.check_for_parent_in_drupal(objects_in_drupal)
-                        views[this_row.id] = this_row
-
-                    elif row_type == 'item':
-                        this_row = Item(row, row_counter)
-                        this_row.validate_structure(objects, items)
-                        this_row.validate_fields()
-                        this_row.check_for_self_in_drupal(items_in_drupal)
-                        this_row.check_for_self_in_drafts(drafts_in_drupal)
-                        this_row.check_for_thumbnail(media_in_drupal)
-                        items[this_row.id] = this_row
-
-                    elif row_type == 'object':
-                        this_row = Object(row, row_counter)
-                        this_row.validate_structure(objects, items)
-                        this_row.validate_fields()
-                        this_row.check_for_self_in_drupal(objects_in_drupal)
-                        this_row.check_for_self_in_drafts(objects_missing_thumbs)
-                        this_row.check_for_parent_in_drupal(items_in_drupal)
-                        this_row.check_for_thumbnail(media_in_drupal)
-                        objects[this_row.id] = this_row
-                    else:
-                        print("WARNING: unknown row type: [{}] on line [{}]. Skipping row.".format(row_type, row_counter))
-                    names_from_this_row = extract_names(row, name_fields)
-                    for name in names_from_this_row.keys():
-                        this_name = Name({'NAME': name,'SORT KEY': names_from_this_row[name]},row_counter)
-                        this_name.check_for_self_in_drupal(names_in_drupal)
-                        this_name.check_for_self_in_drafts(name_drafts_in_drupal)
-                        this_name.validate_structure(names)
-                        names[this_name.id] = this_name
-
-            total_rows_processed += row_counter
-
-
-        ## PRINT REPORT
-        print("\nAssessing results from input files.\n")
-        print("Total rows: {}".format(total_rows_processed))
-        stats = Analysis(objects, items, views, names)
-        print_report(stats)
+        try:
+            if opts.watch:
+                objects, items, views, names, total_rows_processed, stats, lookups = watch_input_files(input_filenames, lookups, name_fields, files_in_dir, skip_file_check, creds, opts.refresh_interval, download_options=download_options, column_pool=column_pool, data_dir=data_dir, scan_threads=opts.scan_threads)
+            else:
+                objects, items, views, names, total_rows_processed = ingest_input_files(input_filenames, lookups, name_fields, files_in_dir, skip_file_check, column_pool=column_pool)
+        except CompressionError as err:
+            print("ERROR: {}".format(err))
+            exit(1)
+
+        if not opts.watch:
+            ## PRINT REPORT
+            print("\nAssessing results from input files.\n")
+            print("Total rows: {}".format(total_rows_processed))
+            stats = Analysis(objects, items, views, names, column_pool)
+            print_report(stats)
 
         obj_config = get_type_config("object")
         item_config = get_type_config("item")
@@ -712,10 +1520,17 @@ def main():
             "6. Add available views to existing objects ({} views)".format(stats.new_views_for_existing_objects),
             "7. Preview names in spreadsheet.",
             "8. Reingest select metadata on existing objects ({} objects)".format(stats.object_existing_total),
+            "9. Review possible duplicate names.",
             "",
-            "i. investigate an object by its id.",
+            "i. investigate objects, items and views (search by id, title or Drupal id).",
             "<enter> to exit.",
         ]
+        choices = ['1','2','3','4','5', '6', '7','8','9','i','']
+        if opts.offline:
+            # The lookups may be stale; files for Drupal written from them could duplicate content there.
+            actions = [x for x in actions if x[:2] not in ('1.', '2.', '3.', '4.', '5.', '6.', '8.')]
+            actions.insert(1, "(Offline: options that write to Drupal are hidden. Run again without --offline to use them.)")
+            choices = ['7','9','i','']
         # WHAT DO YOU WANT TO DO?
         print("\n")
         for line in actions:
@@ -723,14 +1538,15 @@ def main():
 
         while True:
             choice = input("What do you want to do? ")
-            if choice in (['1','2','3','4','5', '6', '7','8','i','']):
+            if choice in choices:
                 break
         if choice == '':
             exit(0)
         print('-------------------------------------------------------------')
-        items_feed = creds['host'] + "/feed/1/edit"
-        names_feed = creds['host'] + '/feed/3/edit'
-        migration_url = creds['host'] + '/admin/structure/migrate/manage/october_27_archive/migrations'
+        if creds:
+            items_feed = creds['host'] + "/feed/1/edit"
+            names_feed = creds['host'] + '/feed/3/edit'
+            migration_url = creds['host'] + '/admin/structure/migrate/manage/october_27_archive/migrations'
         feeds = False
 
         if choice == "1":
@@ -806,7 +1622,7 @@ def main():
             # Write CSV file.
             filename = choice + "-update-existing-objects-with-new-views.csv"
             filtered_objects = [ x for x in views.values() if x.has_file and x.parent_id_in_drupal != False and not x.id_in_drupal ]
-            obj_config = {'parent_id_in_drupal': 'node_id', 'id': 'file'}
+            obj_config = {'parent_id_in_drupal': 'node_id', 'path': 'file'}
             output_objects_as_csv(filename, filtered_objects, obj_config)
             print("Written file. # of objects: {}\n".format(len(filtered_objects)))
 
@@ -816,7 +1632,7 @@ def main():
 
         if choice == '7':
             print("7. Previewing names in the spreadsheet.")
-            filename = choice + '-names-preview.csv'
+            filename = add_compression_extension(choice + '-names-preview.csv', opts.compress_output)
             filtered_names = [ x for x in names.values() ]
             obj_config = {'NAME': 'NAME', 'SORT KEY': 'SORT KEY'}
             output_objects_as_csv(filename, filtered_names, obj_config)
@@ -837,14 +1653,16 @@ def main():
             config_filename = choice + "-workbench_conf.yml"
             output_workbench_config(config_filename, "update", filename, data_dir, nodes_only=True)
 
+        if choice == '9':
+            print("9. Reviewing names in the spreadsheet that may duplicate each other or names in Drupal.")
+            filename = add_compression_extension(choice + '-near-duplicate-names.csv', opts.compress_output)
+            clusters = find_near_duplicate_names(names.keys(), lookups.names.keys())
+            output_name_clusters(filename, clusters, names, lookups.names)
+            print("Written file. # of possible duplicate groups: {}\n".format(len(clusters)))
+            print("\nPlease review the file: {}".format(filename))
+
         if choice == "i":
-            needle = input("Investigating. Enter an id.")
-            if needle in objects.keys():
-                print(objects[needle].values())
-            elif needle in items.keys():
-                print(items[needle].values())
-            elif needle in views.keys():
-                print(views[needle].values())
+            investigate(objects, items, views)
 
 
 